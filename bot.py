@@ -2,10 +2,13 @@ import re
 from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
 from datetime import datetime, timedelta
 import os
+import sys
 import json
+import time
+import struct
 import asyncio
 from pathlib import Path
-from typing import Optional, Dict, List
+from typing import Optional, Dict, Set
 import traceback
 from datetime import datetime
 
@@ -34,7 +37,8 @@ POLL_INTERVAL = float(os.getenv("POLL_INTERVAL", "3.5"))
 
 API_BASE = "https://bubble-portal.com/api/characters/Thana"
 
-STATE_FILE = Path("xp_state.json")    # { "<id>": {"last_xp": int, "name": str, "level": int} }
+STATE_FILE = Path("xp_state.json")    # ancien format JSON, lu uniquement pour migration
+STATE_SNAPSHOT_FILE = Path("xp_state.bin")  # snapshot binaire compact (voir save_state)
 WATCH_FILE = Path("xp_targets.json")  # { "<id>": [<user_id>, ...] }
 
 def ensure_allowed_channel(interaction: discord.Interaction) -> bool:
@@ -54,12 +58,133 @@ def load_json(path: Path, default):
 def save_json(path: Path, data):
     path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
 
-STATE: Dict[str, Dict] = load_json(STATE_FILE, {})
+# ========= État compact =========
+class CharState:
+    """État d'un personnage suivi : slots, nom interné, horodatage epoch (0 = jamais)."""
+    __slots__ = ("last_xp", "name", "level", "last_update", "description")
+
+    def __init__(self, last_xp: int = 0, name: str = "Inconnu", level: int = 0,
+                 last_update: float = 0.0, description: Optional[str] = None):
+        self.last_xp = last_xp
+        self.name = sys.intern(name)
+        self.level = level
+        self.last_update = last_update
+        self.description = description or None
+
+    @classmethod
+    def from_json(cls, d: dict) -> "CharState":
+        """Construit un état depuis une entrée de l'ancien xp_state.json."""
+        ts = 0.0
+        if d.get("last_update"):
+            try:
+                ts = datetime.strptime(d["last_update"], "%Y-%m-%d %H:%M:%S").timestamp()
+            except (TypeError, ValueError):
+                pass
+        return cls(int(d.get("last_xp", 0)), str(d.get("name") or "Inconnu"),
+                   int(d.get("level", 0)), ts, d.get("description"))
+
+
+# Snapshot : en-tête (magic, version, nb) puis, par personnage,
+# (xp, niveau, timestamp, len(id), len(nom), len(note)) suivi des octets UTF-8 de l'id, du nom et de la note.
+_SNAP_MAGIC = b"XPST"
+_SNAP_VERSION = 2
+_SNAP_HEADER = struct.Struct("<4sHI")
+_SNAP_RECORD = struct.Struct("<qqdIII")
+
+def encode_state(state: Dict[str, CharState]) -> bytes:
+    parts = [_SNAP_HEADER.pack(_SNAP_MAGIC, _SNAP_VERSION, len(state))]
+    for cid, rec in state.items():
+        key = cid.encode("utf-8")
+        name = rec.name.encode("utf-8")
+        desc = (rec.description or "").encode("utf-8")
+        parts.append(_SNAP_RECORD.pack(rec.last_xp, rec.level, rec.last_update,
+                                       len(key), len(name), len(desc)))
+        parts.append(key)
+        parts.append(name)
+        parts.append(desc)
+    return b"".join(parts)
+
+def decode_state(buf: bytes) -> Dict[str, CharState]:
+    """
+    Relit un snapshot produit par encode_state ; lève ValueError s'il est tronqué ou invalide.
+
+    >>> st = {"714808153": CharState(7703767260, "Mémé-Colère", 235, 1.5, "note é" * 40000),
+    ...       "007": CharState(1, "x", -1)}
+    >>> back = decode_state(encode_state(st))
+    >>> [(k, r.last_xp, r.name, r.level, r.last_update, r.description == st[k].description)
+    ...  for k, r in back.items()]
+    [('714808153', 7703767260, 'Mémé-Colère', 235, 1.5, True), ('007', 1, 'x', -1, 0.0, True)]
+    >>> back["007"].description is None
+    True
+    >>> decode_state(encode_state(st)[:-2])  # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+    ValueError: snapshot tronqué ou invalide (...)
+    >>> decode_state(encode_state(st) + b"x")  # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+    ValueError: snapshot tronqué ou invalide (...)
+    """
+    magic, version, count = _SNAP_HEADER.unpack_from(buf, 0)
+    if magic != _SNAP_MAGIC or version != _SNAP_VERSION:
+        raise ValueError(f"snapshot invalide ({magic!r} v{version})")
+    view = memoryview(buf)
+    off = _SNAP_HEADER.size
+    out: Dict[str, CharState] = {}
+    for _ in range(count):
+        xp, level, ts, key_len, name_len, desc_len = _SNAP_RECORD.unpack_from(buf, off)
+        off += _SNAP_RECORD.size
+        cid = str(view[off:off + key_len], "utf-8")
+        off += key_len
+        name = str(view[off:off + name_len], "utf-8")
+        off += name_len
+        desc = str(view[off:off + desc_len], "utf-8") if desc_len else None
+        off += desc_len
+        out[cid] = CharState(xp, name, level, ts, desc)
+    if off != len(buf):
+        raise ValueError(f"snapshot tronqué ou invalide ({len(buf)} octets, {off} attendus)")
+    return out
+
+def load_state() -> Dict[str, CharState]:
+    """Charge le snapshot binaire, sinon migre l'ancien xp_state.json s'il n'y a pas encore de snapshot."""
+    if STATE_SNAPSHOT_FILE.exists():
+        try:
+            return decode_state(STATE_SNAPSHOT_FILE.read_bytes())
+        except Exception as e:
+            # On garde le fichier abîmé de côté (horodaté) puis on repart de l'ancien JSON,
+            # éventuellement en retard mais qui contient encore les notes.
+            corrupt = STATE_SNAPSHOT_FILE.with_name(
+                f"{STATE_SNAPSHOT_FILE.name}.corrupt-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+            os.replace(STATE_SNAPSHOT_FILE, corrupt)
+            print(f"[load_state] ⚠️ Snapshot illisible, déplacé vers {corrupt}, repli sur {STATE_FILE}: {e}")
+    raw = load_json(STATE_FILE, {})
+    if not isinstance(raw, dict):
+        return {}
+    out: Dict[str, CharState] = {}
+    for k, v in raw.items():
+        if not isinstance(v, dict):
+            continue
+        try:
+            out[str(k)] = CharState.from_json(v)
+        except (TypeError, ValueError) as e:
+            print(f"[load_state] ⚠️ Entrée {k} ignorée dans {STATE_FILE}: {e}")
+    return out
+
+def save_state():
+    tmp = STATE_SNAPSHOT_FILE.with_suffix(".tmp")
+    tmp.write_bytes(encode_state(STATE))
+    os.replace(tmp, STATE_SNAPSHOT_FILE)
+
+def save_watch():
+    save_json(WATCH_FILE, {cid: sorted(users) for cid, users in WATCH.items()})
+
+def fmt_ts(ts: float) -> str:
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S") if ts else "Jamais"
+
+STATE: Dict[str, CharState] = load_state()
 _raw_watch = load_json(WATCH_FILE, [])
 if isinstance(_raw_watch, list):
-    WATCH: Dict[str, List[int]] = {cid: [] for cid in _raw_watch if isinstance(cid, str)}
+    WATCH: Dict[str, Set[int]] = {cid: set() for cid in _raw_watch if isinstance(cid, str)}
 else:
-    WATCH = {str(k): [int(u) for u in set(v) if isinstance(u, int) or str(u).isdigit()]
+    WATCH = {str(k): {int(u) for u in v if isinstance(u, int) or str(u).isdigit()}
              for k, v in _raw_watch.items()} if isinstance(_raw_watch, dict) else {}
 
 # ========= Discord setup =========
@@ -244,9 +369,10 @@ async def notify_xp_change(char_id: str, before: int, after: int, name: str, lev
     embed.add_field(name="Dernière mise à jour", value=now_str(), inline=False)
 
     # Mentions + note éventuelle
-    followers = WATCH.get(char_id, [])
-    mentions = " ".join(f"<@{uid}>" for uid in set(followers)) if followers else None
-    desc = STATE.get(char_id, {}).get("description")
+    followers = WATCH.get(char_id)
+    mentions = " ".join(f"<@{uid}>" for uid in followers) if followers else None
+    rec = STATE.get(char_id)
+    desc = rec.description if rec else None
     if desc:
         embed.add_field(name="Note", value=desc, inline=False)
 
@@ -315,44 +441,43 @@ async def add_cmd(
             await interaction.followup.send("❌ ID introuvable ou API indisponible.", ephemeral=True)
             return
 
-        name = data.get("name", "Inconnu")
+        name = data.get("name") or "Inconnu"
         level = int(data.get("level", 0))
         xp = int(data.get("experience", 0))
 
         user_id = interaction.user.id
-        followers = WATCH.get(char_id, [])
+        followers = WATCH.get(char_id, set())
 
         # 🔔 Gestion du paramètre notify
         if notify and user_id not in followers:
-            followers.append(user_id)
+            followers.add(user_id)
             WATCH[char_id] = followers
         elif not notify and not followers:
             # si pas de suiveurs mais notify=False, on crée quand même une entrée vide
             WATCH[char_id] = followers
 
-        save_json(WATCH_FILE, WATCH)
+        save_watch()
 
-        entry = STATE.get(char_id, {})
-        entry.update({
-            "last_xp": xp,
-            "name": name,
-            "level": level,
-            "last_update": now_str()
-        })
+        entry = STATE.get(char_id)
+        if entry is None:
+            entry = STATE[char_id] = CharState()
+        entry.last_xp = xp
+        entry.name = sys.intern(str(name))
+        entry.level = level
+        entry.last_update = time.time()
         if description:
-            entry["description"] = description.strip()
-        STATE[char_id] = entry
-        save_json(STATE_FILE, STATE)
+            entry.description = description.strip() or None
+        save_state()
 
         # Message de confirmation
         if notify:
-            extra = f" — _{entry['description']}_" if entry.get("description") else ""
+            extra = f" — _{entry.description}_" if entry.description else ""
             await interaction.followup.send(
                 f"👀 Tu suivras désormais **{name}** (ID `{char_id}`, niv {level}){extra}. "
                 f"Je te ping si son XP change.", ephemeral=True
             )
         else:
-            extra = f" — _{entry['description']}_" if entry.get("description") else ""
+            extra = f" — _{entry.description}_" if entry.description else ""
             await interaction.followup.send(
                 f"👀 **{name}** (ID `{char_id}`, niv {level}) ajouté au suivi{extra}. "
                 f"⚠️ Tu ne seras **pas ping** en cas de variation d'XP.", ephemeral=True
@@ -376,13 +501,13 @@ async def delete_cmd(interaction: discord.Interaction, char_id: str):
         return
     await interaction.response.defer(ephemeral=True)
     try:
-        followers = WATCH.get(char_id, [])
+        followers = WATCH.get(char_id, set())
 
-        if followers == []:
+        if not followers:
             removed_watch = WATCH.pop(char_id, None)  # None si n'existait pas
             removed_state = STATE.pop(char_id, None)
-            save_json(WATCH_FILE, WATCH)
-            save_json(STATE_FILE, STATE)
+            save_watch()
+            save_state()
             if removed_watch is not None or removed_state is not None:
                 await interaction.followup.send(f"🗑️ **{char_id}** supprimé complètement du traqueur.", ephemeral=True)
             else:
@@ -392,15 +517,14 @@ async def delete_cmd(interaction: discord.Interaction, char_id: str):
 
         user_id = interaction.user.id
         if user_id in followers:
-            followers = [u for u in followers if u != user_id]
-            if followers:
-                WATCH[char_id] = followers
-            else:
+            followers.discard(user_id)
+            if not followers:
                 WATCH.pop(char_id, None)
                 STATE.pop(char_id, None)  # facultatif: retirer aussi l'état quand plus de suiveurs
-            save_json(WATCH_FILE, WATCH)
-            save_json(STATE_FILE, STATE)
-            name = STATE.get(char_id, {}).get("name")
+            save_watch()
+            save_state()
+            rec = STATE.get(char_id)
+            name = rec.name if rec else None
             label = f"**{name}** (ID `{char_id}`)" if name else f"ID `{char_id}`"
             await interaction.followup.send(f"✅ Tu ne suis plus {label}.", ephemeral=True)
         else:
@@ -424,11 +548,11 @@ async def list_cmd(interaction: discord.Interaction):
 
         lines = []
         for char_id in sorted(my_ids):
-            entry = STATE.get(char_id, {})
-            name = entry.get("name", "Inconnu")
-            level = entry.get("level", "?")
-            last_up = entry.get("last_update", "Jamais")
-            desc = entry.get("description")
+            entry = STATE.get(char_id)
+            name = entry.name if entry else "Inconnu"
+            level = entry.level if entry else "?"
+            last_up = fmt_ts(entry.last_update) if entry else "Jamais"
+            desc = entry.description if entry else None
 
             block = f"• **{name}** (ID: `{char_id}`)\n"
             block += f"  Niveau : {level}\n"
@@ -460,14 +584,14 @@ async def listall_cmd(interaction: discord.Interaction):
 
         lines = []
         for char_id, followers in sorted(WATCH.items(), key=lambda kv: kv[0]):
-            entry = STATE.get(char_id, {})
-            name = entry.get("name", "Inconnu")
-            level = entry.get("level", "?")
-            last_up = entry.get("last_update", "Jamais")
-            desc = entry.get("description")
+            entry = STATE.get(char_id)
+            name = entry.name if entry else "Inconnu"
+            level = entry.level if entry else "?"
+            last_up = fmt_ts(entry.last_update) if entry else "Jamais"
+            desc = entry.description if entry else None
 
             # Nettoyage des suiveurs -> mentions
-            follower_ids = [int(u) for u in followers if str(u).isdigit()]
+            follower_ids = sorted(followers)
             mentions = " ".join(f"<@{u}>" for u in follower_ids) if follower_ids else "_personne_"
 
             block = f"• **{name}** (ID: `{char_id}`)\n"
@@ -554,6 +678,7 @@ async def poll_loop():
         print("⚠️ CHANNEL_ID invalide ou inaccessible.")
         return
 
+    dirty = False  # un seul snapshot par passage, pas un par personnage modifié
     while not client.is_closed():
         try:
             for char_id in list(WATCH.keys()):
@@ -561,33 +686,41 @@ async def poll_loop():
                 if not data:
                     continue
 
-                name = data.get("name", STATE.get(char_id, {}).get("name", "Inconnu"))
-                level = int(data.get("level", STATE.get(char_id, {}).get("level", 0)))
-                xp = int(data.get("experience", STATE.get(char_id, {}).get("last_xp", 0)))
-
-                if char_id not in STATE:
-                    STATE[char_id] = {"last_xp": xp, "name": name, "level": level}
+                rec = STATE.get(char_id)
+                if rec is None:
+                    STATE[char_id] = CharState(int(data.get("experience", 0)), str(data.get("name") or "Inconnu"),
+                                               int(data.get("level", 0)), time.time())
+                    dirty = True
                     continue
 
-                prev = int(STATE[char_id].get("last_xp", 0))
+                name = data.get("name") or rec.name
+                level = int(data.get("level", rec.level))
+                xp = int(data.get("experience", rec.last_xp))
+                if name != rec.name:
+                    rec.name = sys.intern(str(name))
+                    dirty = True
+
+                prev = rec.last_xp
                 if xp != prev:
-                    STATE[char_id] = {"last_xp": xp, "name": name, "level": level}
-                    save_json(STATE_FILE, STATE)
-                    await notify_xp_change(char_id, prev, xp, name, level)
+                    rec.last_xp = xp
+                    rec.level = level
+                    rec.last_update = time.time()
+                    dirty = True
+                    await notify_xp_change(char_id, prev, xp, rec.name, level)
                 else:
                     # Optionnel: notif de level up
-                    prev_lvl = int(STATE[char_id].get("level", 0))
+                    prev_lvl = rec.level
                     if level != prev_lvl:
-                        STATE[char_id]["level"] = level
-                        STATE[char_id]["last_update"] = now_str()
-                        save_json(STATE_FILE, STATE)
+                        rec.level = level
+                        rec.last_update = time.time()
+                        dirty = True
                         embed = discord.Embed(
                             title="🎉 Niveau augmenté",
-                            description=f"**{name}** (ID `{char_id}`) passe **{prev_lvl} ➜ {level}**",
+                            description=f"**{rec.name}** (ID `{char_id}`) passe **{prev_lvl} ➜ {level}**",
                             color=discord.Color.gold()
                         )
-                        followers = WATCH.get(char_id, [])
-                        mentions = " ".join(f"<@{uid}>" for uid in set(followers)) if followers else None
+                        followers = WATCH.get(char_id)
+                        mentions = " ".join(f"<@{uid}>" for uid in followers) if followers else None
                         await channel.send(content=mentions, embed=embed)
 
         except asyncio.CancelledError:
@@ -595,6 +728,13 @@ async def poll_loop():
         except Exception as e:
             print(f"[poll_loop] erreur: {e}")
 
+        if dirty:
+            try:
+                save_state()
+                dirty = False
+            except Exception:
+                print("[poll_loop] erreur sauvegarde état:\n", traceback.format_exc())
+
         await asyncio.sleep(POLL_INTERVAL)
 
 # ========= Events =========
@@ -639,8 +779,8 @@ async def on_ready():
 
 @client.event
 async def on_disconnect():
-    save_json(STATE_FILE, STATE)
-    save_json(WATCH_FILE, WATCH)
+    save_state()
+    save_watch()
 
 # ========= Main =========
 async def main():